@@ -16,6 +16,7 @@ pip install --upgrade pip
 # Install core PDF processing libraries
 echo "📄 Installing core PDF libraries..."
 pip install pdfplumber>=0.11.0
+pip install PyMuPDF>=1.23.0
 pip install pandas>=2.0.0
 
 # Install OpenAI
@@ -38,6 +39,8 @@ pip install camelot-py[cv]>=0.11.0
 # Install data processing libraries
 echo "📊 Installing data processing libraries..."
 pip install numpy>=1.24.0
+pip install orjson>=3.9.0
+pip install tiktoken>=0.7.0
 pip install matplotlib>=3.7.0
 pip install seaborn>=0.12.0
 
@@ -61,11 +64,13 @@ echo "✅ Installation complete!"
 echo "🔍 Checking installations..."
 python -c "
 import pdfplumber
+import fitz
 import pandas as pd
 import pytesseract
 import openai
 print('✅ Core libraries installed successfully!')
 print(f'pdfplumber: {pdfplumber.__version__}')
+print(f'PyMuPDF: {fitz.VersionBind}')
 print(f'pandas: {pd.__version__}')
 print(f'openai: {openai.__version__}')
 "
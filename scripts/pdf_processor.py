@@ -5,20 +5,33 @@ Uses pdfplumber, pytesseract, and other libraries for comprehensive document ana
 """
 
 import os
+import io
 import sys
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
 import json
 from datetime import datetime
 import re
+import hashlib
+import multiprocessing
+import tempfile
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # PDF Processing Libraries
 import pdfplumber
+import fitz  # PyMuPDF
 import pandas as pd
 from PIL import Image
 import pytesseract
 
+# In-process Tesseract binding (optional); reuses one loaded engine instead of a subprocess per run
+try:
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:
+    PyTessBaseAPI = None
+
 # Additional PDF Libraries
 try:
     import tabula
@@ -32,31 +45,96 @@ except ImportError:
 
 # AI and Data Processing
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import numpy as np
 import requests
 from dotenv import load_dotenv
 
+# Faster serialization and token-aware truncation for prompts (optional)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump these when the model or the prompt/result schema changes so cached results are invalidated
+MODEL_VERSION = "gpt-4o-v1"
+CACHE_SCHEMA_VERSION = 1
+
 class AdvancedPDFProcessor:
     """
     Advanced PDF processor using multiple libraries for maximum extraction accuracy
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None):
+    # Below this many extracted characters per page a PDF is treated as scanned
+    MIN_CHARS_PER_PAGE = 50
+    
+    # Document types worth re-parsing with tabula/camelot when pdfplumber finds no tables
+    TABLE_DOCUMENT_TYPES = ('purchase_invoice', 'utility_bill')
+    
+    # Content keywords per document type, matched in a single pass over the text.
+    # The lookahead lets overlapping keywords (e.g. "hotelectricity") all be seen.
+    CLASSIFIER_RE = re.compile(
+        r'(?=(?P<fuel_receipt>fuel|gasoline|diesel|petrol|pump)'
+        r'|(?P<utility_bill>kwh|electricity|energy|meter)'
+        r'|(?P<travel_expense>flight|airline|hotel|travel))',
+        re.IGNORECASE
+    )
+    
+    # Content-based document types, highest priority first
+    CONTENT_DOCUMENT_TYPES = ('fuel_receipt', 'utility_bill', 'travel_expense')
+    
+    # pdfplumber table detection from ruling lines (its default strategy, made explicit)
+    TABLE_SETTINGS = {"vertical_strategy": "lines", "horizontal_strategy": "lines"}
+    
+    # Pages with both sides at least this many points (A4/Letter and up) are OCR'd at
+    # ocr_dpi; smaller pages such as receipts or A5 slips get SMALL_PAGE_OCR_DPI
+    FULL_PAGE_MIN_POINTS = 500
+    SMALL_PAGE_OCR_DPI = 300
+    
+    # Token budget for the document text in the extraction prompt
+    PROMPT_TEXT_TOKENS = 3500
+    
+    # Shared tiktoken encoder, loaded on first use
+    _token_encoder = None
+    
+    def __init__(self, openai_api_key: Optional[str] = None, ocr_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = None, ocr_dpi: int = 200):
         load_dotenv()
-        self.openai_client = OpenAI(
-            api_key=openai_api_key or os.getenv('OPENAI_API_KEY')
-        )
+        self.openai_api_key = openai_api_key or os.getenv('OPENAI_API_KEY')
+        self._openai_client: Optional[OpenAI] = None
+        
+        # Number of processes used to OCR the pages of a single PDF
+        self.ocr_workers = ocr_workers or os.cpu_count() or 1
+        
+        # OCR resolution for full-size pages; smaller pages use SMALL_PAGE_OCR_DPI
+        self.ocr_dpi = ocr_dpi
+        
+        # Directory for results keyed on the PDF's content hash
+        self.cache_dir = cache_dir or os.getenv('PDF_PROCESSOR_CACHE_DIR', os.path.join('.cache', 'pdf_processor'))
         
         # Configure Tesseract path if needed (adjust for your system)
         # pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'  # Linux
         # pytesseract.pytesseract.tesseract_cmd = '/opt/homebrew/bin/tesseract'  # macOS with Homebrew
         
-    def extract_text_with_pdfplumber(self, pdf_path: str) -> Dict[str, Any]:
+    @property
+    def openai_client(self) -> OpenAI:
+        """
+        OpenAI client, created on first use so parse-only processors never build one
+        """
+        if self._openai_client is None:
+            self._openai_client = OpenAI(api_key=self.openai_api_key)
+        return self._openai_client
+    
+    def extract_text_with_pdfplumber(self, pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Extract text and tables using pdfplumber (most reliable for digital PDFs)
         """
@@ -69,8 +147,11 @@ class AdvancedPDFProcessor:
             'pages': []
         }
         
+        # Collect page texts and join once at the end instead of repeated concatenation
+        text_parts = []
+        
         try:
-            with pdfplumber.open(pdf_path) as pdf:
+            with pdfplumber.open(io.BytesIO(pdf_bytes) if pdf_bytes is not None else pdf_path) as pdf:
                 result['metadata'] = {
                     'total_pages': len(pdf.pages),
                     'title': pdf.metadata.get('Title', ''),
@@ -89,19 +170,21 @@ class AdvancedPDFProcessor:
                     # Extract text
                     page_text = page.extract_text() or ''
                     page_data['text'] = page_text
-                    result['text'] += f"\n--- Page {page_num + 1} ---\n{page_text}"
+                    text_parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}")
                     
-                    # Extract tables
+                    # Extract tables; line-based detection needs ruling lines, rects or
+                    # curves, so pages without any can't contain a table
                     try:
-                        tables = page.extract_tables()
+                        has_rulings = bool(page.lines or page.rects or page.curves)
+                        tables = page.extract_tables(self.TABLE_SETTINGS) if has_rulings else []
                         for table_num, table in enumerate(tables):
                             if table and len(table) > 1:  # Valid table with headers
-                                df = pd.DataFrame(table[1:], columns=table[0])
+                                headers = table[0]
                                 table_dict = {
                                     'page': page_num + 1,
                                     'table_num': table_num + 1,
-                                    'data': df.to_dict('records'),
-                                    'headers': table[0]
+                                    'data': [dict(zip(headers, row)) for row in table[1:]],
+                                    'headers': headers
                                 }
                                 page_data['tables'].append(table_dict)
                                 result['tables'].append(table_dict)
@@ -110,13 +193,17 @@ class AdvancedPDFProcessor:
                     
                     result['pages'].append(page_data)
                     
+                    # Drop the page's parsed layout objects so memory stays flat on long documents
+                    page.flush_cache()
+                    
         except Exception as e:
             logger.error(f"pdfplumber extraction failed: {e}")
             result['error'] = str(e)
-            
+        
+        result['text'] = ''.join(text_parts)
         return result
     
-    def extract_with_tabula(self, pdf_path: str) -> List[pd.DataFrame]:
+    def extract_with_tabula(self, pdf_path: str, pdf_bytes: Optional[bytes] = None) -> List[pd.DataFrame]:
         """
         Extract tables using tabula-py (alternative table extractor)
         """
@@ -128,7 +215,8 @@ class AdvancedPDFProcessor:
         
         try:
             # Extract all tables from all pages
-            tables = tabula.read_pdf(pdf_path, pages='all', multiple_tables=True)
+            source = io.BytesIO(pdf_bytes) if pdf_bytes is not None else pdf_path
+            tables = tabula.read_pdf(source, pages='all', multiple_tables=True)
             logger.info(f"tabula extracted {len(tables)} tables")
             return tables
         except Exception as e:
@@ -164,7 +252,15 @@ class AdvancedPDFProcessor:
             logger.error(f"camelot extraction failed: {e}")
             return []
     
-    def ocr_with_pytesseract(self, pdf_path: str) -> Dict[str, Any]:
+    def _ocr_resolution(self, width_pt: float, height_pt: float) -> int:
+        """
+        Rasterization DPI for a page; Tesseract time scales with pixel count
+        """
+        if min(width_pt, height_pt) >= self.FULL_PAGE_MIN_POINTS:
+            return self.ocr_dpi
+        return max(self.ocr_dpi, self.SMALL_PAGE_OCR_DPI)
+    
+    def ocr_with_pytesseract(self, pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Dict[str, Any]:
         """
         OCR processing for scanned PDFs using pytesseract
         """
@@ -176,47 +272,55 @@ class AdvancedPDFProcessor:
             'confidence': []
         }
         
+        text_parts = []
+        
         try:
-            # Convert PDF pages to images and OCR them
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        # Convert page to image
-                        page_image = page.to_image(resolution=300)
-                        pil_image = page_image.original
-                        
-                        # OCR with confidence data
-                        ocr_data = pytesseract.image_to_data(
-                            pil_image, 
-                            output_type=pytesseract.Output.DICT,
-                            config='--psm 6'  # Uniform text block
-                        )
-                        
-                        # Extract text and confidence
-                        page_text = pytesseract.image_to_string(pil_image, config='--psm 6')
-                        
-                        # Calculate average confidence
-                        confidences = [int(conf) for conf in ocr_data['conf'] if int(conf) > 0]
-                        avg_confidence = np.mean(confidences) if confidences else 0
-                        
-                        page_result = {
-                            'page_number': page_num + 1,
-                            'text': page_text,
-                            'confidence': avg_confidence,
-                            'word_count': len(page_text.split())
-                        }
-                        
-                        result['pages'].append(page_result)
-                        result['text'] += f"\n--- Page {page_num + 1} (OCR) ---\n{page_text}"
-                        result['confidence'].append(avg_confidence)
-                        
-                    except Exception as e:
-                        logger.error(f"OCR failed on page {page_num + 1}: {e}")
+            # Only page sizes are read here; pages are rasterized inside the
+            # workers, one at a time, so no process holds every page image
+            doc = fitz.open(stream=pdf_bytes, filetype='pdf') if pdf_bytes is not None else fitz.open(pdf_path)
+            with doc:
+                page_dpis = [self._ocr_resolution(page.rect.width, page.rect.height) for page in doc]
+            
+            # Split pages into one contiguous range per worker; each range is a
+            # single Tesseract run over an image list
+            n_chunks = max(1, min(self.ocr_workers, len(page_dpis)))
+            chunk_size = max(1, -(-len(page_dpis) // n_chunks))
+            starts = range(0, len(page_dpis), chunk_size)
+            
+            if len(starts) > 1:
+                # Workers reopen the file by path rather than receiving a copy of its bytes
+                chunks = [(pdf_path, start, page_dpis[start:start + chunk_size]) for start in starts]
+                with multiprocessing.Pool(
+                    processes=len(chunks),
+                    initializer=_init_ocr_worker
+                ) as pool:
+                    chunk_results = pool.map(_ocr_pages_worker, chunks)
+            else:
+                source = pdf_bytes if pdf_bytes is not None else pdf_path
+                chunk_results = [_ocr_pages_worker((source, start, page_dpis)) for start in starts]
+            
+            page_results = [page for chunk in chunk_results for page in chunk]
+            
+            for page_num, page_text, avg_confidence in page_results:
+                if page_text is None:
+                    continue
+                
+                page_result = {
+                    'page_number': page_num + 1,
+                    'text': page_text,
+                    'confidence': avg_confidence,
+                    'word_count': len(page_text.split())
+                }
+                
+                result['pages'].append(page_result)
+                text_parts.append(f"\n--- Page {page_num + 1} (OCR) ---\n{page_text}")
+                result['confidence'].append(avg_confidence)
                         
         except Exception as e:
             logger.error(f"OCR processing failed: {e}")
             result['error'] = str(e)
-            
+        
+        result['text'] = ''.join(text_parts)
         return result
     
     def classify_document_type(self, text: str, filename: str) -> str:
@@ -224,7 +328,6 @@ class AdvancedPDFProcessor:
         Classify document type based on content and filename
         """
         filename_lower = filename.lower()
-        text_lower = text.lower()
         
         # Filename-based classification
         if any(word in filename_lower for word in ['fuel', 'gas', 'benzine', 'diesel']):
@@ -237,31 +340,69 @@ class AdvancedPDFProcessor:
             return 'purchase_invoice'
         
         # Content-based classification
-        if any(word in text_lower for word in ['fuel', 'gasoline', 'diesel', 'petrol', 'pump']):
-            return 'fuel_receipt'
-        elif any(word in text_lower for word in ['kwh', 'electricity', 'energy', 'meter']):
-            return 'utility_bill'
-        elif any(word in text_lower for word in ['flight', 'airline', 'hotel', 'travel']):
-            return 'travel_expense'
-        else:
-            return 'other'
+        found = set()
+        for match in self.CLASSIFIER_RE.finditer(text):
+            found.add(match.lastgroup)
+            if match.lastgroup == self.CONTENT_DOCUMENT_TYPES[0]:
+                break  # Highest priority type, nothing can outrank it
+        
+        for document_type in self.CONTENT_DOCUMENT_TYPES:
+            if document_type in found:
+                return document_type
+        return 'other'
     
-    def extract_carbon_data_with_ai(self, text: str, tables: List[Dict], document_type: str) -> Dict[str, Any]:
+    @classmethod
+    def _get_token_encoder(cls):
         """
-        Use OpenAI to extract structured carbon accounting data
+        Load the gpt-4o tokenizer once per process
         """
-        logger.info("Processing extracted content with OpenAI")
+        if cls._token_encoder is None:
+            cls._token_encoder = tiktoken.encoding_for_model("gpt-4o")
+        return cls._token_encoder
+    
+    def _truncate_prompt_text(self, text: str) -> str:
+        """
+        Cut document text to PROMPT_TEXT_TOKENS tokens (first 5000 chars without tiktoken)
+        """
+        if tiktoken is None:
+            return text[:5000]
+        
+        try:
+            encoder = self._get_token_encoder()
+        except Exception as e:
+            logger.warning(f"tiktoken encoder unavailable, truncating by characters: {e}")
+            return text[:5000]
         
+        # No token is longer than ~8 chars in practice, so don't encode more than needed
+        tokens = encoder.encode(text[:self.PROMPT_TEXT_TOKENS * 8])
+        if len(tokens) <= self.PROMPT_TEXT_TOKENS:
+            return text[:self.PROMPT_TEXT_TOKENS * 8]
+        return encoder.decode(tokens[:self.PROMPT_TEXT_TOKENS])
+    
+    def _serialize_prompt_tables(self, tables: List[Dict]) -> str:
+        """
+        Compact JSON for the tables included in the prompt
+        """
+        if orjson is not None:
+            return orjson.dumps(
+                tables, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ).decode()
+        return json.dumps(tables, default=str)
+    
+    def _build_extraction_messages(self, text: str, tables: List[Dict], document_type: str) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for carbon data extraction
+        """
         prompt = f"""
 You are an expert in carbon accounting and emission data extraction. Analyze this {document_type} and extract ALL individual emission-relevant transactions.
 
 DOCUMENT TYPE: {document_type}
 TEXT CONTENT:
-{text[:5000]}  # Limit to first 5000 chars
+{self._truncate_prompt_text(text)}
 
 TABLES FOUND: {len(tables)} tables
 TABLE DATA:
-{json.dumps(tables[:3], indent=2) if tables else "No tables found"}
+{self._serialize_prompt_tables(tables[:3]) if tables else "No tables found"}
 
 EXTRACTION RULES:
 1. Extract EACH individual line item as a separate entry
@@ -296,13 +437,34 @@ Return JSON format:
 }}
 """
 
+        return [
+            {"role": "system", "content": "You are a carbon accounting expert specializing in emission data extraction."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _ai_failure_result(self, document_type: str, error: Exception) -> Dict[str, Any]:
+        """
+        Fallback result when the OpenAI extraction fails
+        """
+        logger.error(f"AI extraction failed: {error}")
+        return {
+            "document_type": document_type,
+            "extraction_confidence": 0.0,
+            "entries": [],
+            "warnings": [f"AI processing failed: {str(error)}"],
+            "suggestions": ["Manual review required"]
+        }
+    
+    def extract_carbon_data_with_ai(self, text: str, tables: List[Dict], document_type: str) -> Dict[str, Any]:
+        """
+        Use OpenAI to extract structured carbon accounting data
+        """
+        logger.info("Processing extracted content with OpenAI")
+        
         try:
             response = self.openai_client.chat.completions.create(
                 model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a carbon accounting expert specializing in emission data extraction."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_extraction_messages(text, tables, document_type),
                 response_format={"type": "json_object"},
                 temperature=0.1
             )
@@ -312,36 +474,116 @@ Return JSON format:
             return result
             
         except Exception as e:
-            logger.error(f"AI extraction failed: {e}")
-            return {
-                "document_type": document_type,
-                "extraction_confidence": 0.0,
-                "entries": [],
-                "warnings": [f"AI processing failed: {str(e)}"],
-                "suggestions": ["Manual review required"]
-            }
+            return self._ai_failure_result(document_type, e)
     
-    def process_pdf_comprehensive(self, pdf_path: str) -> Dict[str, Any]:
+    async def extract_carbon_data_with_ai_async(self, client: AsyncOpenAI, text: str, tables: List[Dict],
+                                                document_type: str) -> Dict[str, Any]:
         """
-        Comprehensive PDF processing using all available methods
+        Async variant of extract_carbon_data_with_ai for running many documents concurrently
         """
-        logger.info(f"Starting comprehensive processing of: {pdf_path}")
+        logger.info("Processing extracted content with OpenAI (async)")
+        
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=self._build_extraction_messages(text, tables, document_type),
+                response_format={"type": "json_object"},
+                temperature=0.1
+            )
+            
+            result = json.loads(response.choices[0].message.content)
+            logger.info(f"AI extracted {len(result.get('entries', []))} entries")
+            return result
+            
+        except Exception as e:
+            return self._ai_failure_result(document_type, e)
+    
+    async def _extract_carbon_data_batch(self, parsed_documents: List[Dict[str, Any]],
+                                         concurrency: int) -> List[Dict[str, Any]]:
+        """
+        Run the AI extraction for parsed documents concurrently, at most `concurrency` in flight
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        try:
+            client = AsyncOpenAI(api_key=self.openai_api_key)
+        except Exception as e:
+            # e.g. no API key: report every document as failed, like the sync path,
+            # so the parsing work still ends up in the per-file results and summary
+            return [self._ai_failure_result(parsed['document_type'], e) for parsed in parsed_documents]
+        
+        async with client:
+            async def extract(parsed: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.extract_carbon_data_with_ai_async(
+                        client, parsed['primary_text'], parsed['tables'], parsed['document_type']
+                    )
+            
+            return await asyncio.gather(*(extract(parsed) for parsed in parsed_documents))
+    
+    def _cache_path(self, pdf_bytes: bytes) -> str:
+        """
+        Location of the cached result for this PDF's content, model and schema version
+        """
+        digest = hashlib.sha256(f"{MODEL_VERSION}:{CACHE_SCHEMA_VERSION}:".encode())
+        digest.update(pdf_bytes)
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.json")
+    
+    def _load_cached_result(self, cache_file: str, pdf_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a previously cached result for pdf_path, or None on a miss.
+        
+        The cache is keyed on content alone, so the entry may come from an upload
+        with another name; its filename and timestamp are replaced with this one's.
+        """
+        if not os.path.exists(cache_file):
+            return None
+        
+        try:
+            with open(cache_file) as f:
+                cached_result = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {cache_file}: {e}")
+            return None
+        
+        cached_result['filename'] = Path(pdf_path).name
+        cached_result['processing_timestamp'] = datetime.now().isoformat()
+        return cached_result
+    
+    def _save_cached_result(self, cache_file: str, final_result: Dict[str, Any]) -> None:
+        """
+        Cache a final result; failed AI extractions are skipped so they are retried next time
+        """
+        if final_result['carbon_data'].get('extraction_confidence', 0) <= 0:
+            return
         
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _write_json(cache_file, final_result)
+        except Exception as e:
+            logger.warning(f"Failed to write cache entry {cache_file}: {e}")
+    
+    def _parse_pdf(self, pdf_path: str, pdf_bytes: bytes) -> Dict[str, Any]:
+        """
+        Run every local extraction stage (text, OCR, tables, classification) without the AI call
+        """
         filename = Path(pdf_path).name
         
         # Method 1: pdfplumber (primary method for digital PDFs)
-        pdfplumber_result = self.extract_text_with_pdfplumber(pdf_path)
+        pdfplumber_result = self.extract_text_with_pdfplumber(pdf_path, pdf_bytes)
+        
+        skipped_stages = []
         
-        # Method 2: OCR for scanned documents (if pdfplumber finds little text)
+        # Method 2: OCR for scanned documents (if pdfplumber finds little text per page)
         ocr_result = None
         text_length = len(pdfplumber_result.get('text', '').strip())
-        if text_length < 100:  # Likely scanned document
-            logger.info("Document appears scanned, using OCR")
-            ocr_result = self.ocr_with_pytesseract(pdf_path)
-        
-        # Method 3: Alternative table extractors
-        tabula_tables = self.extract_with_tabula(pdf_path)
-        camelot_tables = self.extract_with_camelot(pdf_path)
+        total_pages = pdfplumber_result.get('metadata', {}).get('total_pages', 0)
+        chars_per_page = text_length / max(1, total_pages)
+        if chars_per_page < self.MIN_CHARS_PER_PAGE:  # Likely scanned document
+            logger.info(f"Document appears scanned ({chars_per_page:.0f} chars/page), using OCR")
+            ocr_result = self.ocr_with_pytesseract(pdf_path, pdf_bytes)
+        else:
+            skipped_stages.append('ocr')
         
         # Choose best text source
         primary_text = pdfplumber_result.get('text', '')
@@ -351,8 +593,25 @@ Return JSON format:
         else:
             extraction_method = 'pdfplumber'
         
-        # Combine all tables
+        # Classify document
+        document_type = self.classify_document_type(primary_text, filename)
+        
+        # Method 3: Alternative table extractors, only when pdfplumber found no
+        # tables in a document type that usually contains them
         all_tables = pdfplumber_result.get('tables', [])
+        tabula_tables = []
+        camelot_tables = []
+        if not all_tables and document_type in self.TABLE_DOCUMENT_TYPES:
+            tabula_tables = self.extract_with_tabula(pdf_path, pdf_bytes)
+            # camelot only accepts a path; the file is already on disk
+            camelot_tables = self.extract_with_camelot(pdf_path)
+        else:
+            skipped_stages.extend(['tabula', 'camelot'])
+        
+        if skipped_stages:
+            logger.info(f"Skipped stages for {filename}: {', '.join(skipped_stages)}")
+        
+        # Combine all tables
         if tabula_tables:
             for i, df in enumerate(tabula_tables):
                 all_tables.append({
@@ -361,26 +620,33 @@ Return JSON format:
                     'data': df.to_dict('records')
                 })
         
-        # Classify document
-        document_type = self.classify_document_type(primary_text, filename)
-        
-        # AI processing
-        ai_result = self.extract_carbon_data_with_ai(primary_text, all_tables, document_type)
-        
-        # Compile final result
-        final_result = {
+        return {
             'filename': filename,
-            'processing_timestamp': datetime.now().isoformat(),
             'extraction_method': extraction_method,
             'document_type': document_type,
-            'text_length': len(primary_text),
-            'tables_found': len(all_tables),
+            'primary_text': primary_text,
+            'tables': all_tables,
             'processing_results': {
                 'pdfplumber': pdfplumber_result,
                 'ocr': ocr_result,
                 'tabula_tables': len(tabula_tables),
-                'camelot_tables': len(camelot_tables)
-            },
+                'camelot_tables': len(camelot_tables),
+                'skipped_stages': skipped_stages
+            }
+        }
+    
+    def _compile_result(self, parsed: Dict[str, Any], ai_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Combine the parsing stages and the AI extraction into the final result
+        """
+        return {
+            'filename': parsed['filename'],
+            'processing_timestamp': datetime.now().isoformat(),
+            'extraction_method': parsed['extraction_method'],
+            'document_type': parsed['document_type'],
+            'text_length': len(parsed['primary_text']),
+            'tables_found': len(parsed['tables']),
+            'processing_results': parsed['processing_results'],
             'carbon_data': ai_result,
             'summary': {
                 'entries_extracted': len(ai_result.get('entries', [])),
@@ -388,46 +654,113 @@ Return JSON format:
                 'requires_review': ai_result.get('extraction_confidence', 0) < 0.8
             }
         }
+    
+    def process_pdf_comprehensive(self, pdf_path: str) -> Dict[str, Any]:
+        """
+        Comprehensive PDF processing using all available methods
+        """
+        logger.info(f"Starting comprehensive processing of: {pdf_path}")
+        
+        # Read the file once and hand the same bytes to every parser
+        with open(pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        
+        # Identical content was already processed: skip parsing, OCR and the OpenAI call
+        cache_file = self._cache_path(pdf_bytes)
+        cached_result = self._load_cached_result(cache_file, pdf_path)
+        if cached_result is not None:
+            logger.info(f"Using cached result for {Path(pdf_path).name}")
+            return cached_result
+        
+        parsed = self._parse_pdf(pdf_path, pdf_bytes)
+        
+        # AI processing
+        ai_result = self.extract_carbon_data_with_ai(
+            parsed['primary_text'], parsed['tables'], parsed['document_type']
+        )
+        
+        final_result = self._compile_result(parsed, ai_result)
+        self._save_cached_result(cache_file, final_result)
         
         return final_result
     
-    def batch_process_pdfs(self, pdf_paths: List[str], output_dir: str = "output") -> Dict[str, Any]:
+    def batch_process_pdfs(self, pdf_paths: List[str], output_dir: str = "output",
+                           max_workers: Optional[int] = None, ai_concurrency: int = 20) -> Dict[str, Any]:
         """
-        Process multiple PDFs in batch
+        Process multiple PDFs in batch.
+        
+        Parsing and OCR run with one worker process per document; the OpenAI
+        calls for all parsed documents are then sent concurrently.
         """
         logger.info(f"Starting batch processing of {len(pdf_paths)} PDFs")
         
         os.makedirs(output_dir, exist_ok=True)
         
-        results = []
+        results: List[Optional[Dict[str, Any]]] = [None] * len(pdf_paths)
+        pending: Dict[int, Dict[str, Any]] = {}
         successful = 0
         failed = 0
         
+        # Stage 1: parse every PDF in parallel
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_ocr_worker) as executor:
+            futures = {
+                executor.submit(_parse_one, pdf_path, self.cache_dir, self.ocr_dpi): i
+                for i, pdf_path in enumerate(pdf_paths)
+            }
+            
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                pdf_path = pdf_paths[i]
+                logger.info(f"Parsed {done}/{len(pdf_paths)}: {pdf_path}")
+                
+                try:
+                    outcome = future.result()
+                    if 'cached' in outcome:
+                        results[i] = outcome['cached']
+                    else:
+                        pending[i] = outcome
+                    
+                except Exception as e:
+                    logger.error(f"Failed to process {pdf_path}: {e}")
+                    failed += 1
+                    results[i] = {
+                        'filename': Path(pdf_path).name,
+                        'error': str(e),
+                        'processing_timestamp': datetime.now().isoformat()
+                    }
+        
+        # Stage 2: dispatch the AI extraction for all uncached documents at once
+        if pending:
+            indices = list(pending)
+            ai_results = asyncio.run(self._extract_carbon_data_batch(
+                [pending[i]['parsed'] for i in indices], ai_concurrency
+            ))
+            for i, ai_result in zip(indices, ai_results):
+                results[i] = self._compile_result(pending[i]['parsed'], ai_result)
+                self._save_cached_result(pending[i]['cache_file'], results[i])
+        
+        # Save individual results
         for i, pdf_path in enumerate(pdf_paths):
-            logger.info(f"Processing {i+1}/{len(pdf_paths)}: {pdf_path}")
+            if 'error' in results[i]:
+                continue
             
             try:
-                result = self.process_pdf_comprehensive(pdf_path)
-                results.append(result)
-                
-                # Save individual result
                 output_file = os.path.join(
                     output_dir, 
                     f"{Path(pdf_path).stem}_processed.json"
                 )
-                with open(output_file, 'w') as f:
-                    json.dump(result, f, indent=2)
+                _write_json(output_file, results[i])
                 
                 successful += 1
                 
             except Exception as e:
-                logger.error(f"Failed to process {pdf_path}: {e}")
+                logger.error(f"Failed to save result for {pdf_path}: {e}")
                 failed += 1
-                results.append({
+                results[i] = {
                     'filename': Path(pdf_path).name,
                     'error': str(e),
                     'processing_timestamp': datetime.now().isoformat()
-                })
+                }
         
         # Create batch summary
         batch_summary = {
@@ -442,13 +775,185 @@ Return JSON format:
         
         # Save batch summary
         summary_file = os.path.join(output_dir, "batch_summary.json")
-        with open(summary_file, 'w') as f:
-            json.dump(batch_summary, f, indent=2)
+        _write_json(summary_file, batch_summary)
         
         logger.info(f"Batch processing complete: {successful} successful, {failed} failed")
         return batch_summary
 
 
+def _write_json(path: str, data: Any) -> None:
+    """
+    Write indented JSON to a temp file and atomically move it into place,
+    so an interrupted batch never leaves a truncated result behind
+    """
+    if orjson is not None:
+        # OPT_NON_STR_KEYS: pdfplumber tables can have None headers, which json turns into "null"
+        payload = orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    else:
+        payload = json.dumps(data, indent=2).encode()
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+# Per-process tesserocr engine, created once and reused for every page and PDF the process OCRs
+_tess_api = None
+
+
+def _get_tess_api():
+    """
+    Return this process's PyTessBaseAPI, loading the language model on first use
+    """
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK)
+    return _tess_api
+
+
+def _init_ocr_worker() -> None:
+    """
+    Pool initializer: keep each Tesseract process single-threaded so the pool
+    doesn't oversubscribe cores, and load the tesserocr engine up front
+    """
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    if PyTessBaseAPI is not None:
+        _get_tess_api()
+
+
+def _render_pages(source: Union[str, bytes], start: int, page_dpis: List[int]) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Rasterize the pages from start on, one per DPI, yielding (page_num, grayscale image) one at a time
+    """
+    doc = fitz.open(stream=source, filetype='pdf') if isinstance(source, bytes) else fitz.open(source)
+    with doc:
+        for page_num, dpi in enumerate(page_dpis, start=start):
+            # Tesseract binarizes grayscale anyway, so render one channel instead of RGB
+            matrix = fitz.Matrix(dpi / 72, dpi / 72)
+            pix = doc[page_num].get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+            yield page_num, Image.frombytes("L", [pix.width, pix.height], pix.samples)
+
+
+def _ocr_pages_worker(chunk: Tuple[Union[str, bytes], int, List[int]]) -> List[Tuple[int, Optional[str], float]]:
+    """
+    OCR a range of pages given as (PDF path or bytes, first page, per-page DPIs),
+    returning (page_num, text, mean confidence) per page
+    """
+    pages = _render_pages(*chunk)
+    if PyTessBaseAPI is not None:
+        return _ocr_pages_tesserocr(pages)
+    return _ocr_pages_pytesseract(pages)
+
+
+def _ocr_pages_tesserocr(pages: Iterable[Tuple[int, Image.Image]]) -> List[Tuple[int, Optional[str], float]]:
+    """
+    OCR page images in memory with the process's shared tesserocr engine
+    """
+    api = _get_tess_api()
+    
+    results = []
+    for page_num, pil_image in pages:
+        try:
+            api.SetImage(pil_image)
+            api.Recognize()
+            results.append((page_num, api.GetUTF8Text(), float(api.MeanTextConf())))
+        except Exception as e:
+            logger.error(f"OCR failed on page {page_num + 1}: {e}")
+            results.append((page_num, None, 0))
+    
+    return results
+
+
+def _ocr_pages_pytesseract(pages: Iterable[Tuple[int, Image.Image]]) -> List[Tuple[int, Optional[str], float]]:
+    """
+    OCR a chunk of page images with the tesseract CLI.
+    
+    The images are written to a temporary directory and passed to Tesseract as
+    one image list, so the engine and language model are loaded once per chunk
+    instead of once per page. Text is rebuilt line by line from image_to_data's
+    words, so no separate image_to_string run is needed.
+    """
+    page_nums = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='pdf_ocr_') as tmp_dir:
+            image_paths = []
+            for page_num, pil_image in pages:
+                image_path = os.path.join(tmp_dir, f"page_{page_num + 1:05d}.png")
+                pil_image.save(image_path)
+                image_paths.append(image_path)
+                page_nums.append(page_num)
+            
+            list_path = os.path.join(tmp_dir, 'images.txt')
+            with open(list_path, 'w') as f:
+                f.write('\n'.join(image_paths) + '\n')
+            
+            # OCR with confidence data; page_num is 1-based within the image list
+            ocr_data = pytesseract.image_to_data(
+                list_path,
+                output_type=pytesseract.Output.DICT,
+                config='--psm 6'  # Uniform text block
+            )
+    except Exception as e:
+        page_range = f"{page_nums[0] + 1}-{page_nums[-1] + 1}" if page_nums else "in chunk"
+        logger.error(f"OCR failed on pages {page_range}: {e}")
+        return [(page_num, None, 0) for page_num in page_nums]
+    
+    # Word-level confidences as arrays; conf <= 0 marks layout rows and unrecognised words
+    page_index = np.asarray(ocr_data['page_num'], dtype=np.int64) - 1
+    conf = np.asarray(ocr_data['conf'], dtype=np.float64)
+    recognised = conf > 0
+    conf_sum = np.bincount(page_index[recognised], weights=conf[recognised], minlength=len(page_nums))
+    conf_count = np.bincount(page_index[recognised], minlength=len(page_nums))
+    
+    # Group recognised words into lines so the text keeps the layout image_to_string would give
+    lines: Dict[int, List[List[str]]] = {i: [] for i in range(len(page_nums))}
+    last_line: Dict[int, Tuple[int, int, int]] = {}
+    for k in np.flatnonzero(recognised):
+        i = int(page_index[k])
+        line_key = (ocr_data['block_num'][k], ocr_data['par_num'][k], ocr_data['line_num'][k])
+        if last_line.get(i) != line_key:
+            lines[i].append([])
+            last_line[i] = line_key
+        lines[i][-1].append(ocr_data['text'][k])
+    
+    results = []
+    for i, page_num in enumerate(page_nums):
+        page_text = '\n'.join(' '.join(line) for line in lines[i])
+        avg_confidence = float(conf_sum[i] / conf_count[i]) if conf_count[i] else 0
+        results.append((page_num, page_text, avg_confidence))
+    
+    return results
+
+
+def _parse_one(pdf_path: str, cache_dir: Optional[str] = None, ocr_dpi: int = 200) -> Dict[str, Any]:
+    """
+    Parse a single PDF inside a worker process.
+    
+    Returns {'cached': result} on a cache hit, otherwise the parsed document
+    and its cache file so the parent can run the AI stage for the whole batch.
+    Only the parsing settings cross the process boundary; the worker's
+    processor never makes an AI call, so it never creates an OpenAI client.
+    Pages are OCR'd serially here since the batch pool already uses every core.
+    """
+    processor = AdvancedPDFProcessor(ocr_workers=1, cache_dir=cache_dir, ocr_dpi=ocr_dpi)
+    
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+    
+    cache_file = processor._cache_path(pdf_bytes)
+    cached_result = processor._load_cached_result(cache_file, pdf_path)
+    if cached_result is not None:
+        return {'cached': cached_result}
+    
+    return {
+        'parsed': processor._parse_pdf(pdf_path, pdf_bytes),
+        'cache_file': cache_file
+    }
+
+
 def main():
     """
     Example usage of the AdvancedPDFProcessor
@@ -0,0 +1,176 @@
+"""
+Tests for the OCR, classification and batch stages of the advanced PDF processor.
+
+Run with: pytest scripts/test_pdf_processor.py
+"""
+
+import multiprocessing
+import shutil
+
+import pytest
+
+pdf_processor = pytest.importorskip("pdf_processor")
+
+from PIL import Image
+
+
+@pytest.fixture
+def processor(tmp_path):
+    return pdf_processor.AdvancedPDFProcessor(cache_dir=str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def pytesseract_engine(monkeypatch):
+    """Use the tesseract CLI path even when tesserocr is installed"""
+    monkeypatch.setattr(pdf_processor, "PyTessBaseAPI", None)
+
+
+def _tsv(rows):
+    """image_to_data's dict output from (page, block, par, line, conf, text) rows"""
+    keys = ("page_num", "block_num", "par_num", "line_num", "conf", "text")
+    return {key: [row[i] for row in rows] for i, key in enumerate(keys)}
+
+
+def test_pytesseract_output_is_split_into_pages_and_lines(monkeypatch):
+    ocr_data = _tsv([
+        (1, 0, 0, 0, -1, ""),  # layout row
+        (1, 1, 1, 1, 90, "Invoice"),
+        (1, 1, 1, 1, 80, "42"),
+        (1, 1, 1, 2, 70, "Total"),
+        (2, 1, 1, 1, 60, "Diesel"),
+        (2, 1, 1, 1, 0, "~"),  # unrecognised word
+        (2, 2, 1, 1, 100, "40"),
+        (2, 2, 1, 1, 90, "L"),
+        (3, 0, 0, 0, -1, ""),  # blank page
+    ])
+    image_lists = []
+
+    def image_to_data(list_path, output_type, config):
+        with open(list_path) as f:
+            image_lists.append(f.read().split())
+        return ocr_data
+
+    monkeypatch.setattr(pdf_processor.pytesseract, "image_to_data", image_to_data)
+    pages = [(page_num, Image.new("L", (10, 10), 255)) for page_num in (4, 5, 6)]
+
+    results = pdf_processor._ocr_pages_pytesseract(iter(pages))
+
+    # One Tesseract run over the whole chunk
+    assert len(image_lists) == 1 and len(image_lists[0]) == 3
+    assert [(page_num, text) for page_num, text, _ in results] == [
+        (4, "Invoice 42\nTotal"),
+        (5, "Diesel\n40 L"),
+        (6, ""),
+    ]
+    assert [confidence for _, _, confidence in results] == pytest.approx([80.0, 250 / 3, 0])
+
+
+def _write_pdf(path, page_sizes, text=""):
+    fitz = pytest.importorskip("fitz")
+    with fitz.open() as doc:
+        for width, height in page_sizes:
+            page = doc.new_page(width=width, height=height)
+            if text:
+                page.insert_text((36, 72), text, fontsize=24)
+        doc.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize("ocr_workers", [1, 2], ids=["single_chunk", "pooled"])
+def test_ocr_smoke(tmp_path, processor, ocr_workers):
+    pytest.importorskip("fitz")
+    if pdf_processor.PyTessBaseAPI is None and shutil.which("tesseract") is None:
+        pytest.skip("Tesseract is not installed")
+    pdf_path = _write_pdf(tmp_path / "scan.pdf", [(595, 842), (595, 842)], text="Electricity 1250 kWh")
+    processor.ocr_workers = ocr_workers
+
+    result = processor.ocr_with_pytesseract(pdf_path)
+
+    assert "error" not in result
+    assert [page["page_number"] for page in result["pages"]] == [1, 2]
+    for page in result["pages"]:
+        assert "1250" in page["text"]
+
+
+@pytest.mark.parametrize("ocr_workers", [1, 2, 3], ids=["single_chunk", "pooled", "page_per_worker"])
+def test_ocr_page_ranges(tmp_path, monkeypatch, processor, pytesseract_engine, ocr_workers):
+    pytest.importorskip("fitz")
+    if ocr_workers > 1 and multiprocessing.get_start_method() != "fork":
+        pytest.skip("The stubbed engine only reaches pool workers through fork")
+
+    def image_to_data(list_path, output_type, config):
+        # One word per page: the rendered image's width
+        with open(list_path) as f:
+            widths = [Image.open(path).width for path in f.read().split()]
+        return _tsv([(i, 1, 1, 1, 90, str(width)) for i, width in enumerate(widths, start=1)])
+
+    monkeypatch.setattr(pdf_processor.pytesseract, "image_to_data", image_to_data)
+    # A4, a receipt-sized page and A4 again
+    pdf_path = _write_pdf(tmp_path / "scan.pdf", [(595, 842), (216, 400), (595, 842)])
+    processor.ocr_workers = ocr_workers
+
+    result = processor.ocr_with_pytesseract(pdf_path)
+
+    # Every page is OCR'd once, in order, at its own DPI (200 for A4, 300 for the receipt)
+    assert [(page["page_number"], page["text"]) for page in result["pages"]] == [
+        (1, str(round(595 * 200 / 72))),
+        (2, str(round(216 * 300 / 72))),
+        (3, str(round(595 * 200 / 72))),
+    ]
+    assert result["confidence"] == [90, 90, 90]
+
+
+def _classify_before_single_pass(text, filename):
+    """classify_document_type as it was before the single-pass keyword regex"""
+    filename_lower = filename.lower()
+    text_lower = text.lower()
+    if any(word in filename_lower for word in ['fuel', 'gas', 'benzine', 'diesel']):
+        return 'fuel_receipt'
+    elif any(word in filename_lower for word in ['electric', 'energie', 'utility', 'strom']):
+        return 'utility_bill'
+    elif any(word in filename_lower for word in ['travel', 'flight', 'hotel', 'ticket']):
+        return 'travel_expense'
+    elif any(word in filename_lower for word in ['invoice', 'factuur', 'bill']):
+        return 'purchase_invoice'
+    if any(word in text_lower for word in ['fuel', 'gasoline', 'diesel', 'petrol', 'pump']):
+        return 'fuel_receipt'
+    elif any(word in text_lower for word in ['kwh', 'electricity', 'energy', 'meter']):
+        return 'utility_bill'
+    elif any(word in text_lower for word in ['flight', 'airline', 'hotel', 'travel']):
+        return 'travel_expense'
+    else:
+        return 'other'
+
+
+@pytest.mark.parametrize("filename", [
+    "scan_0001.pdf", "Fuel-March.pdf", "energie_2024.pdf", "hotel_stay.pdf", "Factuur 12.pdf", "gas_bill.pdf",
+])
+@pytest.mark.parametrize("text", [
+    "",
+    "Nothing relevant here",
+    "Electricity usage: 1250 kWh",
+    "Hotel stay, then a flight, then the DIESEL pump",
+    "Meter reading 42; travel costs",
+    "hotelectricity",
+    "Airline ticket incl. fuel surcharge",
+    "ENERGY",
+])
+def test_classify_document_type_keeps_priority(processor, text, filename):
+    assert processor.classify_document_type(text, filename) == _classify_before_single_pass(text, filename)
+
+
+def test_batch_without_api_key_reports_failed_extractions(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    processor = pdf_processor.AdvancedPDFProcessor(cache_dir=str(tmp_path / "cache"))
+    pdf_path = _write_pdf(tmp_path / "march.pdf", [(595, 842)], text="Electricity usage 1250 kWh " * 3)
+    output_dir = tmp_path / "output"
+
+    summary = processor.batch_process_pdfs([pdf_path], output_dir=str(output_dir), max_workers=1)
+
+    [result] = summary["results"]
+    assert result["filename"] == "march.pdf"
+    assert result["carbon_data"]["warnings"][0].startswith("AI processing failed")
+    assert (output_dir / "march_processed.json").exists()
+    assert (output_dir / "batch_summary.json").exists()
+    # Failed extractions aren't cached, so they are retried next time
+    assert not (tmp_path / "cache").exists() or not any((tmp_path / "cache").iterdir())
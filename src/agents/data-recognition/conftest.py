@@ -0,0 +1,2 @@
+# test_agent.py is a command-line script that processes real files, not a test module
+collect_ignore = ["test_agent.py"]
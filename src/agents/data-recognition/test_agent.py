@@ -7,12 +7,25 @@ This script tests the agent's functionality on sample files.
 import os
 import json
 import sys
+import glob
+import time
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from agent import process_file
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Characters that make an argument a glob pattern rather than a file name
+GLOB_CHARS = "*?["
+
 def test_agent():
     """
     Test the Carbon Data Recognition Agent with sample files.
@@ -26,53 +39,156 @@ def test_agent():
     print("Carbon Data Recognition Agent Test")
     print("=================================")
     
-    # Get the test file path from command line arguments or use default
-    if len(sys.argv) > 1:
-        test_file = sys.argv[1]
-    else:
-        # Use default test file if none provided
-        test_file = "example.pdf"
-        print(f"No test file provided. Using default: {test_file}")
+    parser = argparse.ArgumentParser(description="Test the Carbon Data Recognition Agent")
+    parser.add_argument("files", nargs="*",
+                        help="Files or quoted glob patterns, e.g. 'invoices/*.pdf' (default: example.pdf)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Extraction threads; values above 1 process files in parallel")
+    parser.add_argument("--bench", action="store_true",
+                        help="Time each file and report latency percentiles (implied by glob patterns)")
+    parser.add_argument("--quiet", action="store_true", help="Don't print per-file results")
+    args = parser.parse_args()
     
-    # Check if the file exists
-    if not os.path.isfile(test_file):
-        print(f"Error: File '{test_file}' does not exist.")
-        print("Please provide a valid file path.")
-        sys.exit(1)
+    # Expand glob patterns ourselves, so they work when quoted or on Windows
+    test_files = []
+    for pattern in args.files:
+        if any(char in pattern for char in GLOB_CHARS):
+            args.bench = True
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                print(f"Error: No files match '{pattern}'.")
+                sys.exit(1)
+            test_files.extend(matches)
+        else:
+            test_files.append(pattern)
+    
+    # Use default test file if none provided
+    if not test_files:
+        test_files = ["example.pdf"]
+        print(f"No test file provided. Using default: {test_files[0]}")
     
-    print(f"Processing file: {test_file}")
+    # Check if the files exist
+    for test_file in test_files:
+        if not os.path.isfile(test_file):
+            print(f"Error: File '{test_file}' does not exist.")
+            print("Please provide a valid file path.")
+            sys.exit(1)
+    
+    # Imported after the key check so a misconfigured run fails fast
+    import agent
+    from agent import process_file, process_files_parallel
     
     try:
-        # Process the file with the agent
-        result = process_file(test_file)
-        
-        # Pretty-print the result
-        print("\nResult:")
-        print(json.dumps(result, indent=2))
+        if args.bench:
+            run_bench(test_files, args.workers, agent, args.quiet)
+            return
         
-        # Check if the processing was successful
-        if result.get("success"):
-            print("\n✅ File processed successfully!")
-            
-            # Print the extracted data
-            print("\nExtracted Data:")
-            data = result.get("data", {}).get("mapped_data", {})
-            for key, value in data.items():
-                print(f"  {key}: {value}")
-            
-            # Check for missing fields
-            missing = result.get("missing_fields", [])
-            if missing:
-                print("\n⚠️ Missing Fields:")
-                for field in missing:
-                    print(f"  - {field}")
+        # Process the files with the agent
+        if args.workers > 1 or len(test_files) > 1:
+            print(f"Processing {len(test_files)} file(s) with {args.workers} worker(s)")
+            results = process_files_parallel(test_files, extract_workers=max(1, args.workers))
         else:
-            print("\n❌ File processing failed.")
+            print(f"Processing file: {test_files[0]}")
+            results = [process_file(test_files[0])]
+        
+        if not args.quiet:
+            for test_file, result in zip(test_files, results):
+                report_result(test_file, result)
     
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
         import traceback
         traceback.print_exc()
 
+def run_bench(test_files, workers, agent, quiet=False):
+    """
+    Time the agent over many files and print latency and throughput.
+    
+    Per-file latency is measured around process_file calls fanned out over a
+    thread pool; throughput is measured on process_files_parallel, which
+    pipelines extraction and mapping. Each pass gets an empty result cache, on
+    disk and in memory, so neither times cache hits.
+    """
+    workers = max(1, workers)
+    print(f"Benchmarking {len(test_files)} file(s) with {workers} worker(s)")
+    
+    def timed(test_file):
+        start = time.perf_counter_ns()
+        result = agent.process_file(test_file)
+        return result, time.perf_counter_ns() - start
+    
+    cache_dir = os.environ.get("CIRCA_CACHE_DIR")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_cache:
+            os.environ["CIRCA_CACHE_DIR"] = tmp_cache
+            # The in-process cache layer isn't keyed on the directory
+            agent._load_cached_json.cache_clear()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                timed_results = list(executor.map(timed, test_files))
+        
+        with tempfile.TemporaryDirectory() as tmp_cache:
+            os.environ["CIRCA_CACHE_DIR"] = tmp_cache
+            agent._load_cached_json.cache_clear()
+            start = time.perf_counter_ns()
+            agent.process_files_parallel(test_files, extract_workers=workers)
+            pipeline_ns = time.perf_counter_ns() - start
+    finally:
+        agent._load_cached_json.cache_clear()
+        if cache_dir is None:
+            os.environ.pop("CIRCA_CACHE_DIR", None)
+        else:
+            os.environ["CIRCA_CACHE_DIR"] = cache_dir
+    
+    if not quiet:
+        for test_file, (result, _) in zip(test_files, timed_results):
+            report_result(test_file, result)
+    
+    latencies_ms = sorted(elapsed / 1e6 for _, elapsed in timed_results)
+    if len(latencies_ms) > 1:
+        cut_points = statistics.quantiles(latencies_ms, n=20, method="inclusive")
+        p50, p95 = cut_points[9], cut_points[18]
+    else:
+        p50 = p95 = latencies_ms[0]
+    succeeded = sum(1 for result, _ in timed_results if result.get("success"))
+    
+    print("\nBenchmark:")
+    print(f"  files:      {len(test_files)} ({succeeded} succeeded)")
+    print(f"  p50:        {p50:.1f} ms")
+    print(f"  p95:        {p95:.1f} ms")
+    print(f"  max:        {latencies_ms[-1]:.1f} ms")
+    print(f"  pipeline:   {pipeline_ns / 1e6:.1f} ms ({len(test_files) / (pipeline_ns / 1e9):.1f} files/s)")
+
+def report_result(test_file, result):
+    """
+    Print the processing result for a single file.
+    """
+    # Pretty-print the result
+    print(f"\nResult for {test_file}:")
+    if orjson is not None:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS) + b"\n")
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(result, indent=2))
+    
+    # Check if the processing was successful
+    if result.get("success"):
+        print("\n✅ File processed successfully!")
+        
+        # Print the extracted data
+        print("\nExtracted Data:")
+        data = result.get("data", {}).get("mapped_data", {})
+        for key, value in data.items():
+            print(f"  {key}: {value}")
+        
+        # Check for missing fields
+        missing = result.get("missing_fields", [])
+        if missing:
+            print("\n⚠️ Missing Fields:")
+            for field in missing:
+                print(f"  - {field}")
+    else:
+        print("\n❌ File processing failed.")
+
 if __name__ == "__main__":
     test_agent() 
\ No newline at end of file
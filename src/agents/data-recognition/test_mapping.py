@@ -0,0 +1,86 @@
+"""
+Unit tests for the pattern-based schema mapping in the Carbon Data Recognition Agent.
+
+Run with: pytest src/agents/data-recognition
+"""
+
+import pytest
+
+from agent import _UNKNOWN_VALUE, _mapping_text, _parse_amount, _prefill_schema
+
+
+@pytest.mark.parametrize("number, expected", [
+    ("1234", 1234.0),
+    ("3.5", 3.5),
+    ("3,5", 3.5),
+    ("0.125", 0.125),
+    ("0,125", 0.125),
+    # A single kind of separator splitting valid 3-digit groups is a thousands separator
+    ("1,234", 1234.0),
+    ("1.234", 1234.0),
+    ("10.000", 10000.0),
+    ("1.250", 1250.0),
+    ("1.234.567", 1234567.0),
+    ("1,234,567", 1234567.0),
+    # With both separators, the last one is the decimal point
+    ("1,234.5", 1234.5),
+    ("1.234,5", 1234.5),
+    # Trailing punctuation from the surrounding sentence is ignored
+    ("1.250.", 1250.0),
+])
+def test_parse_amount(number, expected):
+    assert _parse_amount(number) == expected
+
+
+@pytest.mark.parametrize("number", ["1.2.3", "1,23,4", "01,1.250", "1,23.5", "0,123.5"])
+def test_parse_amount_rejects_malformed_groups(number):
+    assert _parse_amount(number) is None
+
+
+def test_prefill_schema_reads_invoice_fields():
+    record = _prefill_schema("Invoice No: INV-2024-001\nPeriod 2024-03-01\nTotal usage 1.234,5 kWh")
+
+    assert record.date == "2024-03-01"
+    assert record.year == 2024
+    assert record.type == "electricity"
+    assert record.amount == 1234.5
+    assert record.amount_unit == "kWh"
+    assert record.invoice_id == "INV-2024-001"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Gasverbruik 2024-02-01: 1.250 m3", ("natural gas", 1250.0, "m3")),
+    ("Gas 12 m³ delivered", ("natural gas", 12.0, "m3")),
+    ("Electricity 3,5 MWh", ("electricity", 3.5, "MWh")),
+    ("Diesel 40 litres", ("fuel", 40.0, "liters")),
+    # The amount doesn't run back over the date and the CSV delimiter
+    ("date,usage\n2024-03-01,1.250 kWh\n", ("electricity", 1250.0, "kWh")),
+])
+def test_prefill_schema_units(text, expected):
+    record = _prefill_schema(text)
+
+    assert (record.type, record.amount, record.amount_unit) == expected
+
+
+def test_prefill_schema_leaves_unmatched_fields_unknown():
+    record = _prefill_schema("Thank you for your business")
+
+    assert record.unknown_fields() == list(record.to_dict())
+    assert record.invoice_id == _UNKNOWN_VALUE
+
+
+def test_pdf_page_filter_keeps_every_unit_page():
+    extracted = {
+        "file_type": "pdf",
+        "extraction_method": "pymupdf",
+        "text_content": "Invoice from Acme, cover letter\fGas consumption 2024-02-01: 1.250 m3"
+                        "\fElectricity 3,5 MWh\fTerms and conditions",
+    }
+
+    text = _mapping_text(extracted)
+
+    assert "1.250 m3" in text
+    assert "3,5 MWh" in text
+    assert "Terms and conditions" not in text
+    record = _prefill_schema(text)
+    assert (record.date, record.type, record.amount) == ("2024-02-01", "natural gas", 1250.0)
@@ -0,0 +1,63 @@
+"""
+Tests for fetching MCP context in the Carbon Data Recognition Agent.
+
+Run with: pytest src/agents/data-recognition
+"""
+
+import asyncio
+
+import pytest
+
+import agent
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Every aiohttp session the agent creates"""
+    created = []
+    new_session = aiohttp.ClientSession
+
+    def recording_session(*args, **kwargs):
+        created.append(new_session(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(aiohttp, "ClientSession", recording_session)
+    return created
+
+
+async def _fetch_from_flaky_api(statuses):
+    """Serve the given statuses in turn, then fetch the context; returns (context, requests)"""
+    requests = []
+
+    async def mcp_context(request):
+        requests.append(request.query["companyId"])
+        status = statuses[len(requests) - 1] if len(requests) <= len(statuses) else 200
+        return web.json_response({"company": {"id": request.query["companyId"]}}, status=status)
+
+    app = web.Application()
+    app.router.add_get("/api/mcp-context", mcp_context)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        context = agent._CarbonMCPContextBase("acme", api_base_url=f"http://127.0.0.1:{port}")
+        result = await context.fetch_context()
+    finally:
+        await runner.cleanup()
+    return result, requests
+
+
+def test_fetch_context_retries_and_closes_its_session(monkeypatch, sessions):
+    monkeypatch.setattr(agent, "_MCP_BACKOFF_SECONDS", 0)
+
+    result, requests = asyncio.run(_fetch_from_flaky_api([503]))
+
+    assert result == {"company": {"id": "acme"}}
+    assert requests == ["acme", "acme"]
+    # Nothing is left open once the event loop that made the request is gone
+    assert sessions and all(session.closed for session in sessions)
@@ -0,0 +1,139 @@
+"""
+Tests for process_file and its result cache in the Carbon Data Recognition Agent.
+
+Run with: pytest src/agents/data-recognition
+"""
+
+import json
+
+import pytest
+
+import agent
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    """Point the result cache at an empty directory and drop in-process memoization"""
+    monkeypatch.setenv("CIRCA_CACHE_DIR", str(tmp_path / "cache"))
+    agent._load_cached_json.cache_clear()
+    yield
+    agent._load_cached_json.cache_clear()
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Record calls to the LLM field filler, which fails like an outage by default"""
+    calls = []
+
+    def fill_fields(text, fields):
+        calls.append(fields)
+        raise ConnectionError("API unreachable")
+
+    monkeypatch.setattr(agent, "_fill_fields_with_llm", fill_fields)
+    return calls
+
+
+def test_llm_failure_is_reported_and_not_cached(tmp_path, llm_calls):
+    upload = tmp_path / "usage.csv"
+    upload.write_text("supplier,notes\nAcme Energy,monthly statement\n")
+
+    first = agent.process_file(str(upload))
+    second = agent.process_file(str(upload))
+
+    assert first["warnings"] == ["LLM mapping failed: API unreachable"]
+    assert first["success"] is False
+    # Not served from the cache: the LLM is tried again
+    assert len(llm_calls) == 2
+    assert second["warnings"] == first["warnings"]
+
+
+def test_pattern_mapped_result_is_cached(tmp_path, llm_calls):
+    upload = tmp_path / "usage.csv"
+    upload.write_text("date,usage\n2024-03-01,1.250 kWh\n")
+
+    first = agent.process_file(str(upload))
+    second = agent.process_file(str(upload))
+
+    assert first["success"] is True
+    assert first["warnings"] == []
+    assert first["data"]["mapped_data"]["amount"] == 1250.0
+    assert llm_calls == []
+    assert second["data"] == first["data"]
+
+
+def test_placeholder_text_is_never_mapped(tmp_path, llm_calls, monkeypatch):
+    batch_calls = []
+    monkeypatch.setattr(agent, "_map_batch_with_llm", lambda *args: batch_calls.append(args))
+    upload = tmp_path / "2024-03-01_invoice.txt"
+    upload.write_text("Invoice INV-1 2024-03-01 1.250 kWh")
+
+    single = agent.process_file(str(upload))
+    [batched] = agent.process_files([str(upload)])
+
+    for result in (single, batched):
+        assert result["success"] is False
+        assert result["warnings"] == ["Text extraction is not supported for text files"]
+        # Nothing was read off the placeholder text or the file name
+        assert result["data"]["mapped_data"]["date"] == agent._UNKNOWN_VALUE
+    assert llm_calls == []
+    assert batch_calls == []
+
+
+@pytest.mark.parametrize("process", [
+    lambda path: agent.process_file(path),
+    lambda path: agent.process_files([path])[0],
+    lambda path: agent.process_files_parallel([path])[0],
+], ids=["process_file", "process_files", "process_files_parallel"])
+def test_cache_hit_describes_the_new_upload(tmp_path, llm_calls, process):
+    content = "date,usage\n2024-03-01,1.250 kWh\n"
+    first_upload = tmp_path / "one.csv"
+    second_upload = tmp_path / "two.CSV"
+    first_upload.write_text(content)
+    second_upload.write_text(content)
+
+    first = agent.process_file(str(first_upload))
+    second = process(str(second_upload))
+
+    assert second["data"]["mapped_data"]["amount"] == 1250.0
+    assert second["data"]["mapped_data"] == first["data"]["mapped_data"]
+    assert second["file_info"]["filename"] == "two.CSV"
+    assert second["file_info"]["path"] == str(second_upload)
+    assert second["data"]["original_file"] == str(second_upload)
+    assert second["processed_at"] >= first["processed_at"]
+
+
+def test_cache_is_not_shared_across_file_types(tmp_path, llm_calls):
+    content = "date,usage\n2024-03-01,1.250 kWh\n"
+    csv_upload = tmp_path / "a.csv"
+    txt_upload = tmp_path / "b.txt"
+    csv_upload.write_text(content)
+    txt_upload.write_text(content)
+
+    from_csv = agent.process_file(str(csv_upload))
+    from_txt = agent.process_file(str(txt_upload))
+
+    assert from_csv["success"] is True
+    # Same bytes, but a .txt upload is never mapped: no CSV result from the cache
+    assert from_txt["success"] is False
+    assert from_txt["file_info"]["type"] == "text"
+    assert from_txt["warnings"] == ["Text extraction is not supported for text files"]
+
+
+def test_csv_text_keeps_values_as_written(tmp_path):
+    upload = tmp_path / "meters.csv"
+    upload.write_text("customer_id,usage,read_at\n00123,1.250,2024-03-01 10:00:00\n")
+
+    extracted = agent.extract_text_from_file(str(upload))
+
+    for value in ("00123", "1.250", "2024-03-01 10:00:00"):
+        assert value in extracted["text_content"]
+
+
+def test_map_to_carbon_schema_returns_plain_json(tmp_path, llm_calls):
+    upload = tmp_path / "usage.csv"
+    upload.write_text("date,usage\n2024-03-01,1.250 kWh\n")
+
+    mapped = agent.map_to_carbon_schema(agent.extract_text_from_file(str(upload)))
+
+    # Registered as an agent tool, so its result goes through json.dumps
+    assert json.loads(json.dumps(mapped))["mapped_data"]["amount"] == 1250.0